@@ -0,0 +1,11 @@
+import multiprocessing
+import os
+
+# makes script.py build the db at import in the master process (see GEONAMES_PRELOAD there),
+# forked workers then share it copy-on-write
+os.environ["GEONAMES_PRELOAD"] = "1"
+preload_app = True
+
+bind = "127.0.0.1:8000"
+worker_class = "uvicorn.workers.UvicornWorker"
+workers = 2 * multiprocessing.cpu_count() + 1
@@ -1,11 +1,20 @@
+import bisect
 import datetime
 import dataclasses
+import functools
+import gc
+import itertools
+import mmap
+import operator
+import os
+import sys
 import pytz
-from fastapi import FastAPI, HTTPException, status
+from fastapi import FastAPI, HTTPException, Query, status
+from fastapi.responses import ORJSONResponse
 import uvicorn
 
 
-@dataclasses.dataclass
+@dataclasses.dataclass(slots=True)
 class GeoInfo:
     geonameid: int
     name: str
@@ -28,7 +37,7 @@ class GeoInfo:
     modification_date: datetime.date
 
 
-@dataclasses.dataclass
+@dataclasses.dataclass(slots=True)
 class GeoInfoCompare:
         north: str
         is_same_time: bool
@@ -38,56 +47,118 @@ class GeoInfoCompare:
 
 
 class MemDataBase:
-    hashed_db: dict[int, GeoInfo]
+    rows: list[GeoInfo]
+    hashed_db: dict[int, int]
     hashed_db_names: dict[str, list[GeoInfo]]
+    sorted_names: list[str]
 
     def __init__(self, file: str) -> None:
-        self.hashed_db = self.init_db(file)
-        self.hashed_db_names = self.init_hased_names(self.hashed_db)
+        self.rows = self.init_db(file)
+        self.hashed_db = {geo_item.geonameid: i for i, geo_item in enumerate(self.rows)}
+        self.hashed_db_names = self.init_hased_names(self.rows)
+        self.sorted_names = list(self.hashed_db_names)  # already built in name order
+        # db is never mutated after startup, so hints for a prefix never change
+        self.get_name_help = functools.lru_cache(maxsize=4096)(self.get_name_help)
 
     @staticmethod
-    def init_db(file: str) -> dict[int, GeoInfo]:
-        db = {}
-        for line in open(file).readlines():
-            geo_item = GeoInfo(*line.strip().split('\t'))
-            if geo_item.feature_class == "P":  # filter city, town, villages, etc...
-                db[int(geo_item.geonameid)] = geo_item
-        return db
+    def parse_geo_info(parts: list[str]) -> GeoInfo:
+        # interned columns have only a few distinct values shared by all rows
+        return GeoInfo(
+            geonameid=int(parts[0]),
+            name=parts[1],
+            asciiname=parts[2],
+            alternatenames=parts[3],
+            latitude=float(parts[4]),
+            longitude=float(parts[5]),
+            feature_class=sys.intern(parts[6]),
+            feature_code=sys.intern(parts[7]),
+            country_code=sys.intern(parts[8]),
+            cc2=parts[9],
+            admin1_code=sys.intern(parts[10]),
+            admin2_code=parts[11],
+            admin3_code=parts[12],
+            admin4_code=parts[13],
+            population=int(parts[14]),
+            elevation=parts[15],
+            dem=parts[16],
+            timezone=sys.intern(parts[17]),
+            modification_date=datetime.date.fromisoformat(parts[18]),
+        )
+
+    @staticmethod
+    def init_db(file: str) -> list[GeoInfo]:
+        rows = []
+        with open(file, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for line in iter(mm.readline, b''):
+                # filter city, town, villages, etc... before decoding the line
+                if line.split(b'\t', 7)[6] == b"P":
+                    parts = line.decode().rstrip('\r\n').split('\t')
+                    rows.append(MemDataBase.parse_geo_info(parts))
+        return rows
     
     @staticmethod
-    def init_hased_names(db: dict[int, GeoInfo]) -> dict[str, list[GeoInfo]]:
-        hashed_names = {}
-        for geo_item in sorted(db.values(), key=lambda gi: int(gi.population)):
-            for name in geo_item.alternatenames.split(','):
-                hashed_names.update({
-                    name: [geo_item] + hashed_names.get(name, [])
-                    })
-        return hashed_names
+    def init_hased_names(rows: list[GeoInfo]) -> dict[str, list[GeoInfo]]:
+        pairs = [
+            (name, -geo_item.population, geo_item)
+            for geo_item in reversed(rows)
+            for name in geo_item.alternatenames.split(',')
+            if name
+        ]
+        # by name, most populated first, so get_by_name(...)[0] is the largest one;
+        # the stable sort of reversed rows puts the later row in file first on ties
+        pairs.sort(key=operator.itemgetter(0, 1))
+        return {
+            name: [pair[2] for pair in group]
+            for name, group in itertools.groupby(pairs, key=operator.itemgetter(0))
+        }
 
     def get_by_id(self, id: int) -> GeoInfo | None:
-        return self.hashed_db.get(id)
+        i = self.hashed_db.get(id)
+        return None if i is None else self.rows[i]
 
     def get_list(self, skip: int, limit: int) -> list[GeoInfo]:
-        return list(self.hashed_db.values())[skip:skip+limit]
+        return self.rows[skip:skip+limit]
 
     def get_by_name(self, name: str) -> list[GeoInfo] | None: 
         return self.hashed_db_names.get(name)
 
     def get_name_help(self, name_part: str, limit: int) -> list[str]:
-        possible_names = [
-            name
-            for name in self.hashed_db_names.keys()
-            if name.startswith(name_part)
-        ][:limit] 
+        # names sharing a prefix are adjacent in sorted order
+        start = bisect.bisect_left(self.sorted_names, name_part)
+        possible_names = []
+        for name in self.sorted_names[start:start+limit]:
+            if not name.startswith(name_part):
+                break
+            possible_names.append(name)
         return possible_names
 
 
 class Service:
+    timezones: set[str] = set()
+    timezone_diffs: dict[tuple[str, str], tuple[float, str]] = {}
+    timezone_diffs_hour: datetime.datetime | None = None
+
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def get_timezone(name: str) -> pytz.BaseTzInfo:
+        return pytz.timezone(name)
+
+    @staticmethod
+    def is_known_timezone(name: str) -> bool:
+        try:
+            Service.get_timezone(name)
+        except pytz.UnknownTimeZoneError:
+            return False
+        return True
+
+    @staticmethod
+    def current_utc_hour() -> datetime.datetime:
+        return datetime.datetime.now(datetime.timezone.utc).replace(minute=0, second=0, microsecond=0)
 
     @staticmethod
     def timezone_diff(tz1, tz2):
-        tz1 = pytz.timezone(tz1)
-        tz2 = pytz.timezone(tz2)
+        tz1 = Service.get_timezone(tz1)
+        tz2 = Service.get_timezone(tz2)
         dt = datetime.datetime.now()
         
         delta_time = tz1.utcoffset(dt) - tz2.utcoffset(dt)
@@ -99,57 +170,97 @@ class Service:
 
         return delta_minutes, delta_str
 
+    @staticmethod
+    def init_timezone_diffs(timezones: set[str]) -> None:
+        # rows with an empty or unknown zone must not abort startup,
+        # /diff for them fails on its own in get_timezone_diff
+        timezones = {tz for tz in timezones if Service.is_known_timezone(tz)}
+        Service.timezones = timezones
+        Service.timezone_diffs = {
+            (tz1, tz2): Service.timezone_diff(tz1, tz2)
+            for tz1 in timezones
+            for tz2 in timezones
+        }
+        Service.timezone_diffs_hour = Service.current_utc_hour()
+        Service.compare.cache_clear()  # cached comparisons hold the old diffs
+
+    @staticmethod
+    def get_timezone_diff(tz1: str, tz2: str) -> tuple[float, str]:
+        diff = Service.timezone_diffs.get((tz1, tz2))
+        return Service.timezone_diff(tz1, tz2) if diff is None else diff
+
     @staticmethod
     def get_diff_info(name_1: str, name_2: str, db: MemDataBase) -> GeoInfoCompare | None:
+        # offsets change only at DST transitions, which happen on an hour boundary
+        if Service.timezone_diffs_hour != Service.current_utc_hour():
+            Service.init_timezone_diffs(Service.timezones)
+        return Service.compare(name_1, name_2, db)
+
+    @staticmethod
+    @functools.lru_cache(maxsize=1024)
+    def compare(name_1: str, name_2: str, db: MemDataBase) -> GeoInfoCompare | None:
+        # db is immutable, results only change with the timezone diffs
         gi_1, gi_2 = db.get_by_name(name_1), db.get_by_name(name_2)
         if gi_1 is None or gi_2 is None:
             return None
         gi_1, gi_2 = gi_1[0], gi_2[0]
 
-        time_delta, time_delta_str = Service.timezone_diff(gi_1.timezone, gi_2.timezone)
+        time_delta, time_delta_str = Service.get_timezone_diff(gi_1.timezone, gi_2.timezone)
         north = name_1 if gi_1.latitude >= gi_2.latitude else name_2
         is_same_timezone = time_delta == 0
 
         return GeoInfoCompare(north=north, is_same_time=is_same_timezone, timezone_diff=time_delta_str, name_1=gi_1, name_2=gi_2)
 
 
-app = FastAPI(title="GeoNames API")
-mem_db: MemDataBase
+app = FastAPI(title="GeoNames API", default_response_class=ORJSONResponse)
+CACHE_CONTROL = "public, max-age=86400"  # responses only change on restart
+mem_db: MemDataBase | None = None
 
 
 @app.on_event("startup")
 def db_up():
     global mem_db
+    if mem_db is not None:  # already built at import, see gunicorn.conf.py
+        return
     mem_db = MemDataBase("RU.txt")
+    Service.init_timezone_diffs({gi.timezone for gi in mem_db.rows})
+
+
+# set by gunicorn.conf.py: build the db in the gunicorn master before workers fork
+if os.environ.get("GEONAMES_PRELOAD"):
+    db_up()
+    # move the db out of the collector's reach, otherwise the first gc pass in
+    # every worker writes to each object header and un-shares the copied pages
+    gc.freeze()
 
+# Records are trusted in-memory data: handlers return ORJSONResponse directly,
+# which skips response_model validation (kept for the docs) and jsonable_encoder.
+#
+# Handlers run on the event loop, so keep them `async def` only while they do
+# O(1)/O(limit) in-memory work (well under ~100 µs of CPU). Anything slower,
+# e.g. a full scan of the db, must be a plain `def` so FastAPI moves it to the threadpool.
 @app.get('/info', response_model=GeoInfo)
-async def info(id: int):
-    if id < 0:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="id must be >= 0")
+async def info(id: int = Query(..., ge=0)):
     res = mem_db.get_by_id(id)
     if res is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="id not found")
-    return res 
+    return ORJSONResponse(res, headers={"Cache-Control": CACHE_CONTROL})
 
 @app.get('/', response_model=list[GeoInfo])
-async def pagination(page: int = 0, limit: int = 10):
-    if page < 0 or 0 > limit > 1000:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="page must be >= 0 and 0 < limit <= 1000")
-    return mem_db.get_list(page*limit, limit)
+async def pagination(page: int = Query(0, ge=0), limit: int = Query(10, gt=0, le=1000)):
+    return ORJSONResponse(mem_db.get_list(page*limit, limit))
 
 @app.get('/diff', response_model=GeoInfoCompare)
 async def diff(name_1: str, name_2: str):
     res = Service.get_diff_info(name_1, name_2, mem_db)
     if res is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="one of names not found")
-    return res 
+    return ORJSONResponse(res)
 
 @app.get('/help', response_model=list[str])
-async def help(name_part: str, limit: int = 10) -> list[str]:
-    if name_part == '' or 0 > limit > 1000:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="name must contain symbols and 0 < limit <= 1000")
-    return mem_db.get_name_help(name_part, limit)
+async def help(name_part: str = Query(..., min_length=1), limit: int = Query(10, gt=0, le=1000)):
+    return ORJSONResponse(mem_db.get_name_help(name_part, limit), headers={"Cache-Control": CACHE_CONTROL})
 
 
 if __name__ == "__main__":
-    uvicorn.run("script:app", port=8000, host="127.0.0.1", reload=True)
+    uvicorn.run("script:app", port=8000, host="127.0.0.1", reload=True, loop="uvloop", http="httptools")